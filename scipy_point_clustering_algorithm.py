@@ -32,7 +32,7 @@ __revision__ = '$Format:%H$'
 import os.path
 
 from PyQt4.QtCore import QVariant
-from qgis.core import QgsField, QgsFeature, QgsGeometry, QgsPoint, QgsFields
+from qgis.core import QgsField, QgsGeometry, QgsPoint, QgsFields
 
 from processing.core.GeoAlgorithm import GeoAlgorithm
 from processing.core.ProcessingConfig import ProcessingConfig
@@ -45,7 +45,25 @@ from processing.tools import dataobjects, vector
 import numpy as np
 import scipy.cluster.vq
 import scipy.cluster.hierarchy
-from scipy.spatial.distance import pdist, squareform
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial import cKDTree
+from scipy.spatial.distance import pdist
+
+try:
+    import fastcluster
+except ImportError:
+    fastcluster = None
+
+try:
+    from sklearn.cluster import DBSCAN, KMeans, MiniBatchKMeans
+except ImportError:
+    DBSCAN = KMeans = MiniBatchKMeans = None
+
+try:
+    from sklearn.metrics import pairwise_distances
+except ImportError:
+    pairwise_distances = None
 
 from scipy_point_clustering_utils import ScipyPointClusteringUtils
 
@@ -151,16 +169,27 @@ class HierarchicalClustering(GeoAlgorithm):
         # QgsVectorLayer in this case) using the
         # processing.getObjectFromUri() method.
         vectorLayer = dataobjects.getObjectFromUri(inputFilename)
+        provider = vectorLayer.dataProvider()
+        fields = provider.fields()
+        geometry_type = provider.geometryType()
+        crs = provider.crs()
 
         # And now we can process
 
         # Loop over the features to get the geometries and the associated
         # feature id
-        feature_count = vectorLayer.selectedFeatureCount()
+        features = vector.features(vectorLayer)
+        feature_count = len(features)
         point_limit = int(ProcessingConfig.getSetting(
             ScipyPointClusteringUtils.POINT_LIMIT
         ))
-        if feature_count > point_limit:
+        # Single linkage clusters at a distance are the connected components
+        # of the graph joining every pair of points within the tolerance. A
+        # k-d tree finds those pairs without building a distance matrix, so
+        # the number of pairs is limited instead, to use about as much memory
+        # as the distance matrix at the point limit.
+        use_tree = method == 'single' and criterion == 'distance'
+        if feature_count > point_limit and not use_tree:
             progress.setInfo(
                 "Number of features ({}) exceeds the plugin point limit ({}). "
                 "If necessary the point limit setting can be adjusted in the "
@@ -173,68 +202,112 @@ class HierarchicalClustering(GeoAlgorithm):
         progress.setInfo("Extracting geometries from the input layer",
                          error=False)
 
-        features = vector.features(vectorLayer)
-        points = []
-        feature_ids = []
-        for i, f in enumerate(features, 1):
-            progress.setPercentage(
-                i * 30. / feature_count
-            )
-            g = f.geometry()
-            p = g.asPoint()
-            points.append([p.x(), p.y()])
-            feature_ids.append(f.id())
+        feature_attributes = []
+        feature_geometries = []
+        # only update the progress bar once per percent
+        progress_step = max(1, feature_count // 100)
+        for i, f in enumerate(features):
+            if i % progress_step == 0:
+                progress.setPercentage(
+                    i * 30. / feature_count
+                )
+            # keep copies of the features so the input layer is only read
+            # once
+            feature_attributes.append(f.attributes())
+            feature_geometries.append(QgsGeometry(f.geometry()))
+
+        points = ScipyPointClusteringUtils.pointCoordinates(feature_geometries)
+        # Distances between geographic coordinates are meaningless, so cluster
+        # in metres on a local plane instead
+        ScipyPointClusteringUtils.projectGeographic(points, crs)
 
         # actually do the clustering
-        points = np.array(points)
+        # Coincident points always share a cluster, and for single and
+        # complete linkage they don't change the distances between clusters.
+        # If there are lots of them, cluster the unique locations instead.
+        inverse = None
+        if (method in ('single', 'complete') and
+                criterion in ('distance', 'maxclust')):
+            # np.unique only takes an axis from numpy 1.13, so view each
+            # point as a single structured value instead
+            rows = np.ascontiguousarray(points).view(
+                [('', points.dtype)] * 2).ravel()
+            unique_rows, inverse = np.unique(rows, return_inverse=True)
+            if len(unique_rows) < 0.5 * feature_count:
+                points = unique_rows.view(points.dtype).reshape(-1, 2)
+            else:
+                inverse = None
 
         progress.setInfo("Building hierarchical clusters")
 
-        y = scipy.cluster.hierarchy.fclusterdata(
-            points,
-            tolerance,
-            criterion=criterion,
-            method=method,
-            metric=metric
-        )
-        progress.setPercentage(60)
+        if use_tree:
+            tree = cKDTree(points)
+            p = 1 if metric == 'cityblock' else 2
+            pair_count = ScipyPointClusteringUtils.countPairs(
+                tree, tolerance, p)
+            pair_limit = ScipyPointClusteringUtils.pairLimit(
+                point_limit, ScipyPointClusteringUtils.TREE_BYTES_PER_PAIR)
+            if pair_count > pair_limit:
+                progress.setInfo(
+                    "Number of point pairs within the cluster tolerance ({}) "
+                    "exceeds the limit ({}) set by the plugin point limit "
+                    "({}). If necessary the point limit setting can be "
+                    "adjusted in the Processing Options for the Scipy Point "
+                    "Clustering provider.".format(
+                        pair_count, pair_limit, point_limit
+                    ),
+                    error=True
+                )
+                raise ValueError("Pair count > pair limit")
+
+            pairs = ScipyPointClusteringUtils.queryPairs(tree, tolerance, p)
+            graph = coo_matrix(
+                (np.ones(len(pairs), dtype=bool), (pairs[:, 0], pairs[:, 1])),
+                shape=(len(points), len(points))
+            )
+            _, y = connected_components(graph, directed=False)
+            # number the clusters from 1 like fcluster
+            y += 1
+        else:
+            # fastcluster's memory saving linkage only supports some of the
+            # methods, and only euclidean distances for the geometric ones
+            if fastcluster is not None and (
+                    method == 'single' or
+                    (method in ('centroid', 'median', 'ward') and
+                     metric == 'euclidean')):
+                links = fastcluster.linkage_vector(
+                    points, method=method, metric=metric)
+            else:
+                links = scipy.cluster.hierarchy.linkage(
+                    pdist(points, metric=metric), method=method)
+
+            y = scipy.cluster.hierarchy.fcluster(
+                links,
+                tolerance,
+                criterion=criterion
+            )
 
-        labels = dict(zip(feature_ids, y))
+        if inverse is not None:
+            # give every feature the label of its location
+            y = y[inverse]
+        progress.setPercentage(60)
 
         # Now write the features to the new dataset along with the label
         #label_idx = fields.fieldNameIndex(fieldName)
 
-        provider = vectorLayer.dataProvider()
-        fields = provider.fields()
         fields.append(QgsField(fieldName, QVariant.Int))
-        writer = output.getVectorWriter(
-            fields, provider.geometryType(), provider.crs())
-
-        #assert False, labels
-
-        out_feature = QgsFeature()
-        out_feature.setFields(fields)
+        writer = output.getVectorWriter(fields, geometry_type, crs)
 
         progress.setInfo("Writing clustered data to output")
 
-        features = vector.features(vectorLayer)
-        for i, f in enumerate(features, 1):
-            progress.setPercentage(
-                60 + i * 30. / feature_count
-            )
-
-            attributes = f.attributes()
-            attributes.append(int(labels[f.id()]))
-
-            geom = f.geometry()
-
-            out_feature.setGeometry(geom)
-            out_feature.setAttributes(attributes)
-
-            writer.addFeature(out_feature)
+        # the labels are converted to python ints in one go
+        ScipyPointClusteringUtils.writeFeatures(
+            writer, fields, feature_geometries, feature_attributes,
+            y.tolist(), progress, 60, 30)
         del writer
 
-        num_clusters = len(np.unique(y))
+        # fcluster labels the clusters 1 to n
+        num_clusters = int(y.max())
         self.setOutputValue(self.NUM_CLUSTERS, num_clusters)
 
         progress.setInfo("{} clusters formed.".format(num_clusters))
@@ -351,6 +424,10 @@ class KMeansClustering(GeoAlgorithm):
         # QgsVectorLayer in this case) using the
         # processing.getObjectFromUri() method.
         vectorLayer = dataobjects.getObjectFromUri(inputFilename)
+        provider = vectorLayer.dataProvider()
+        fields = provider.fields()
+        geometry_type = provider.geometryType()
+        crs = provider.crs()
 
         # And now we can process
 
@@ -360,81 +437,80 @@ class KMeansClustering(GeoAlgorithm):
                          error=False)
 
         features = vector.features(vectorLayer)
-        feature_count = vectorLayer.selectedFeatureCount()
-        points = []
-        feature_ids = []
-        for i, f in enumerate(features, 1):
-            progress.setPercentage(
-                i * 25. / feature_count
-            )
-            g = f.geometry()
-            p = g.asPoint()
-            points.append([p.x(), p.y()])
-            feature_ids.append(f.id())
+        feature_count = len(features)
+        feature_attributes = []
+        feature_geometries = []
+        progress_step = max(1, feature_count // 100)
+        for i, f in enumerate(features):
+            if i % progress_step == 0:
+                progress.setPercentage(
+                    i * 25. / feature_count
+                )
+            # keep copies of the features so the input layer is only read
+            # once
+            feature_attributes.append(f.attributes())
+            feature_geometries.append(QgsGeometry(f.geometry()))
+
+        points = ScipyPointClusteringUtils.pointCoordinates(feature_geometries)
+        # Distances between geographic coordinates are meaningless, so cluster
+        # in metres on a local plane instead
+        scale = ScipyPointClusteringUtils.projectGeographic(points, crs)
 
         # actually do the clustering
-        points = np.array(points)
-
         progress.setInfo("Building k-means clusters")
 
-        centroids, y = scipy.cluster.vq.kmeans2(points, k, minit=minit)
+        if KMeans is not None:
+            # scikit-learn prunes most of the distance calculations, so use
+            # it when it is available. Its 'random' initialisation picks
+            # observations like the scipy 'points' method.
+            init = 'k-means++' if minit == 'random' else 'random'
+            if feature_count > 20000:
+                km = MiniBatchKMeans(
+                    n_clusters=k, init=init, batch_size=4096)
+            else:
+                try:
+                    km = KMeans(n_clusters=k, init=init, algorithm='elkan')
+                except TypeError:
+                    # the elkan algorithm was added in scikit-learn 0.18
+                    km = KMeans(n_clusters=k, init=init)
+            km.fit(points)
+            centroids, y = km.cluster_centers_, km.labels_
+        else:
+            centroids, y = scipy.cluster.vq.kmeans2(points, k, minit=minit)
 
         progress.setPercentage(50)
 
-        labels = dict(zip(feature_ids, y))
-
-        provider = vectorLayer.dataProvider()
-        fields = provider.fields()
         fields.append(QgsField(fieldName, QVariant.Int))
-        writer = output.getVectorWriter(
-            fields, provider.geometryType(), provider.crs())
-
-        # assert False, labels
-
-        out_feature = QgsFeature()
-        out_feature.setFields(fields)
+        writer = output.getVectorWriter(fields, geometry_type, crs)
 
         progress.setInfo("Writing clustered data to output")
 
-        features = vector.features(vectorLayer)
-        for i, f in enumerate(features, 1):
-            progress.setPercentage(
-                50 + i * 25. / feature_count
-            )
-            attributes = f.attributes()
-            attributes.append(int(labels[f.id()]))
-
-            geom = f.geometry()
-
-            out_feature.setGeometry(geom)
-            out_feature.setAttributes(attributes)
-
-            writer.addFeature(out_feature)
+        # the labels are converted to python ints in one go
+        ScipyPointClusteringUtils.writeFeatures(
+            writer, fields, feature_geometries, feature_attributes,
+            y.tolist(), progress, 50, 25)
         del writer
 
         progress.setInfo("Writing centroids to output")
 
         fields = QgsFields()
         fields.append(QgsField(fieldName, QVariant.Int))
-        writer = centroid_output.getVectorWriter(
-            fields, provider.geometryType(), provider.crs())
-
-        out_feature = QgsFeature()
-        out_feature.setFields(fields)
-
-        for i, centroid in enumerate(centroids):
-            progress.setPercentage(
-                90 + i * 10. / k
-            )
-
-            geom = QgsPoint(*centroid)
-            out_feature.setGeometry(QgsGeometry.fromPoint(geom))
-            out_feature.setAttributes([i, ])
-            writer.addFeature(out_feature)
+        writer = centroid_output.getVectorWriter(fields, geometry_type, crs)
+
+        # undo the projection for all the centroids at once
+        centroid_geometries = [
+            QgsGeometry.fromPoint(QgsPoint(x, y_))
+            for x, y_ in (centroids / scale).tolist()
+        ]
+        ScipyPointClusteringUtils.writeFeatures(
+            writer, fields, centroid_geometries,
+            [[] for _ in centroid_geometries], list(range(k)),
+            progress, 90, 10)
 
         del writer
 
-        num_clusters = len(np.unique(y))
+        # empty clusters are possible, so count the labels actually used
+        num_clusters = int(np.count_nonzero(np.bincount(y)))
         self.setOutputValue(self.NUM_CLUSTERS, num_clusters)
 
         progress.setInfo("{} clusters formed.".format(num_clusters))
@@ -512,10 +588,15 @@ class HierarchicalClusteringByIdentifier(HierarchicalClustering):
         # QgsVectorLayer in this case) using the
         # processing.getObjectFromUri() method.
         vectorLayer = dataobjects.getObjectFromUri(inputFilename)
+        provider = vectorLayer.dataProvider()
+        fields = provider.fields()
+        geometry_type = provider.geometryType()
+        crs = provider.crs()
 
         # And now we can process
 
-        feature_count = vectorLayer.selectedFeatureCount()
+        features = vector.features(vectorLayer)
+        feature_count = len(features)
         point_limit = int(ProcessingConfig.getSetting(
             ScipyPointClusteringUtils.POINT_LIMIT
         ))
@@ -536,38 +617,68 @@ class HierarchicalClusteringByIdentifier(HierarchicalClustering):
         # Loop over the features to get the geometries and the associated
         # feature id
 
-        features = vector.features(vectorLayer)
-        points = []
-        feature_ids = []
+        feature_attributes = []
+        feature_geometries = []
         identifiers = []
-        for i, f in enumerate(features, 1):
-            progress.setPercentage(
-                i * 20. / feature_count
-            )
-            g = f.geometry()
-            p = g.asPoint()
-            points.append([p.x(), p.y()])
-            feature_ids.append(f.id())
-            identifiers.append(f[identifier_field])
+        identifier_idx = fields.fieldNameIndex(identifier_field)
+        progress_step = max(1, feature_count // 100)
+        for i, f in enumerate(features):
+            if i % progress_step == 0:
+                progress.setPercentage(
+                    i * 20. / feature_count
+                )
+            # keep copies of the features so the input layer is only read
+            # once
+            attributes = f.attributes()
+            feature_attributes.append(attributes)
+            feature_geometries.append(QgsGeometry(f.geometry()))
+            identifiers.append(attributes[identifier_idx])
+
+        points = ScipyPointClusteringUtils.pointCoordinates(feature_geometries)
+        # Distances between geographic coordinates are meaningless, so cluster
+        # in metres on a local plane instead
+        ScipyPointClusteringUtils.projectGeographic(points, crs)
 
         # actually do the clustering
-        points = np.array(points)
-        identifiers = np.array(identifiers)
+        # Replace the identifiers with integer codes so the mask below is a
+        # plain integer comparison. Keep the values as python objects until
+        # then so numpy doesn't coerce mixed types (e.g. numbers and NULL)
+        # to strings.
+        _, identifiers = np.unique(
+            np.asarray(identifiers, dtype=object), return_inverse=True)
+        identifiers = identifiers.astype(np.int32)
 
         progress.setInfo("Building hierarchical clusters")
 
         # no we ensure that no matter how close the points are, the locatiosn of
         # the clusters is dependent on the label.
-        distances = squareform(pdist(points, metric=metric))
-        increase_offseets = np.array([
-            identifiers != val for val in identifiers
-        ])
-        distances[increase_offseets] = np.inf
-        distances = squareform(distances) # recompress the distance matrix
+        # The mask is applied to the condensed distance matrix a row at a
+        # time, so the full square matrix is never built.
+        if pairwise_distances is not None:
+            # scikit-learn can calculate the distances in parallel
+            distances = ScipyPointClusteringUtils.condensedDistances(
+                points, identifiers,
+                lambda a, b: pairwise_distances(
+                    a, b, metric=metric, n_jobs=-1)
+            )
+        else:
+            # For euclidean distances take the square root after masking, so
+            # it is only calculated for the distances that are kept
+            squared = metric == 'euclidean'
+            distances = pdist(
+                points, metric='sqeuclidean' if squared else metric)
+            start = 0
+            for i in range(feature_count - 1):
+                end = start + feature_count - 1 - i
+                row = distances[start:end]
+                row[identifiers[i + 1:] != identifiers[i]] = np.inf
+                start = end
+            if squared:
+                np.sqrt(distances, out=distances,
+                        where=np.isfinite(distances))
         progress.setPercentage(40)
 
-        links = scipy.cluster.hierarchy.linkage(
-            distances, method=method, metric=metric)
+        links = scipy.cluster.hierarchy.linkage(distances, method=method)
 
         y = scipy.cluster.hierarchy.fcluster(
             links,
@@ -576,47 +687,242 @@ class HierarchicalClusteringByIdentifier(HierarchicalClustering):
         )
         progress.setPercentage(60)
 
-        labels = dict(zip(feature_ids, y))
-
         # Now write the features to the new dataset along with the label
         # label_idx = fields.fieldNameIndex(fieldName)
 
-        provider = vectorLayer.dataProvider()
-        fields = provider.fields()
         fields.append(QgsField(fieldName, QVariant.Int))
-        writer = output.getVectorWriter(
-            fields, provider.geometryType(), provider.crs())
+        writer = output.getVectorWriter(fields, geometry_type, crs)
+
+        progress.setInfo("Writing clustered data to output")
 
-        # assert False, labels
+        # the labels are converted to python ints in one go
+        ScipyPointClusteringUtils.writeFeatures(
+            writer, fields, feature_geometries, feature_attributes,
+            y.tolist(), progress, 60, 30)
+        del writer
 
-        out_feature = QgsFeature()
-        out_feature.setFields(fields)
+        # fcluster labels the clusters 1 to n
+        num_clusters = int(y.max())
+        self.setOutputValue(self.NUM_CLUSTERS, num_clusters)
 
-        progress.setInfo("Writing clustered data to output")
+        progress.setInfo("{} clusters formed.".format(num_clusters))
+        progress.setPercentage(100)
+
+    def help(self):
+        """
+        Get the help documentation for this algorithm.
+        :return: Help text is html from string, the help html
+        :rtype: bool, str
+        """
+        help_data = open(os.path.join(
+            os.path.dirname(__file__),
+            "doc",
+            "hierarchical_clustering_by_identifier.html"
+        )).read()
+
+        return True, help_data
+
+
+class DBSCANClustering(GeoAlgorithm):
+    """
+    DBSCAN clustering implementation from scikit-learn.
+
+    Uses a k-d tree to find the neighbours of each point, so unlike
+    hierarchical clustering no distance matrix is built. The point limit is
+    applied to the number of neighbouring pairs instead.
+
+    Only available when scikit-learn is installed.
+    """
+
+    OUTPUT_LAYER = 'OUTPUT_LAYER'
+    INPUT_LAYER = 'INPUT_LAYER'
+    TOLERANCE = 'TOLERANCE'
+    MIN_SAMPLES = 'MIN_SAMPLES'
+    METRIC = 'METRIC'
+    LABEL_FIELD = 'LABEL_FIELD'
+    NUM_CLUSTERS = 'NUM_CLUSTERS'
+
+    _metrics = ['euclidean', 'cityblock']
+
+    def defineCharacteristics(self):
+        """Here we define the inputs and output of the algorithm, along
+        with some other properties.
+        """
+        self.name = 'DBSCAN clustering'
+
+        # The branch of the toolbox under which the algorithm will appear
+        self.group = 'Vector'
+
+        # We add the input vector layer. It can have any kind of geometry
+        # It is a mandatory (not optional) one, hence the False argument
+        self.addParameter(ParameterVector(
+            self.INPUT_LAYER,
+            self.tr('Input layer'),
+            [ParameterVector.VECTOR_TYPE_POINT],
+            False
+        ))
+
+        self.addParameter(ParameterNumber(
+            self.TOLERANCE, self.tr('Cluster tolerance'), minValue=0.0))
+
+        self.addParameter(ParameterNumber(
+            self.MIN_SAMPLES,
+            self.tr('Minimum points in a cluster'),
+            minValue=1,
+            default=1
+        ))
+
+        self.addParameter(ParameterString(
+            self.LABEL_FIELD, self.tr('Label field name'), 'label'
+        ))
+
+        self.addParameter(ParameterSelection(
+            self.METRIC, self.tr('Distance metric'),
+            self._metrics
+        ))
+
+        # We add a vector layer as output
+        self.addOutput(OutputVector(self.OUTPUT_LAYER,
+                                    self.tr('Clustered features')))
+
+        self.addOutput(OutputNumber(
+            self.NUM_CLUSTERS, self.tr("Number of clusters formed")
+        ))
+
+    def processAlgorithm(self, progress):
+        """
+        Here is where the processing itself takes place.
+
+        :param progress: Interface to the processing window
+        :type progress: processing.gui.AlgorithmDialog.AlgorithmDialog
+        """
+
+        # The first thing to do is retrieve the values of the parameters
+        # entered by the user
+        inputFilename = self.getParameterValue(self.INPUT_LAYER)
+        output = self.getOutputFromName(self.OUTPUT_LAYER)
+        fieldName = self.getParameterValue(self.LABEL_FIELD)
+        tolerance = float(self.getParameterValue(self.TOLERANCE))
+        min_samples = int(self.getParameterValue(self.MIN_SAMPLES))
+        metric = self._metrics[self.getParameterValue(self.METRIC)]
+
+        progress.setPercentage(0)
+
+        if tolerance <= 0.0:
+            progress.setInfo("Please set a cluster tolerance greater than zero",
+                             error=True)
+            raise ValueError("Tolerance <= zero")
+
+        if min_samples != float(self.getParameterValue(self.MIN_SAMPLES)):
+            progress.setInfo("Minimum points must be a whole number",
+                             error=True)
+            raise ValueError("Minimum points is not an integer")
+
+        # Input layers vales are always a string with its location.
+        # That string can be converted into a QGIS object (a
+        # QgsVectorLayer in this case) using the
+        # processing.getObjectFromUri() method.
+        vectorLayer = dataobjects.getObjectFromUri(inputFilename)
+        provider = vectorLayer.dataProvider()
+        fields = provider.fields()
+        geometry_type = provider.geometryType()
+        crs = provider.crs()
+
+        # And now we can process
+
+        # Loop over the features to get the geometries and the associated
+        # feature id
+        progress.setInfo("Extracting geometries from the input layer",
+                         error=False)
 
         features = vector.features(vectorLayer)
-        for i, f in enumerate(features, 1):
-            progress.setPercentage(
-                60 + i * 30. / feature_count
+        feature_count = len(features)
+        feature_attributes = []
+        feature_geometries = []
+        progress_step = max(1, feature_count // 100)
+        for i, f in enumerate(features):
+            if i % progress_step == 0:
+                progress.setPercentage(
+                    i * 30. / feature_count
+                )
+            # keep copies of the features so the input layer is only read
+            # once
+            feature_attributes.append(f.attributes())
+            feature_geometries.append(QgsGeometry(f.geometry()))
+
+        points = ScipyPointClusteringUtils.pointCoordinates(feature_geometries)
+        # Distances between geographic coordinates are meaningless, so cluster
+        # in metres on a local plane instead
+        ScipyPointClusteringUtils.projectGeographic(points, crs)
+
+        # DBSCAN holds the neighbours of every point in memory, so limit the
+        # number of pairs within the tolerance to use about as much memory as
+        # the distance matrix at the point limit. Counting the pairs needs a
+        # separate k-d tree, but handing DBSCAN a precomputed sparse distance
+        # matrix from it would use several times more memory than letting
+        # DBSCAN build its own.
+        point_limit = int(ProcessingConfig.getSetting(
+            ScipyPointClusteringUtils.POINT_LIMIT
+        ))
+        pair_count = ScipyPointClusteringUtils.countPairs(
+            cKDTree(points), tolerance, 1 if metric == 'cityblock' else 2)
+        pair_limit = ScipyPointClusteringUtils.pairLimit(
+            point_limit, ScipyPointClusteringUtils.DBSCAN_BYTES_PER_PAIR)
+        if pair_count > pair_limit:
+            progress.setInfo(
+                "Number of point pairs within the cluster tolerance ({}) "
+                "exceeds the limit ({}) set by the plugin point limit "
+                "({}). If necessary the point limit setting can be "
+                "adjusted in the Processing Options for the Scipy Point "
+                "Clustering provider.".format(
+                    pair_count, pair_limit, point_limit
+                ),
+                error=True
             )
+            raise ValueError("Pair count > pair limit")
 
-            attributes = f.attributes()
-            attributes.append(int(labels[f.id()]))
+        # actually do the clustering
+        progress.setInfo("Building DBSCAN clusters")
+
+        y = DBSCAN(
+            eps=tolerance,
+            min_samples=min_samples,
+            metric=metric,
+            algorithm='kd_tree',
+            n_jobs=-1
+        ).fit_predict(points)
+
+        # Match the fcluster labels, numbering the clusters from 1 and giving
+        # each noise point a cluster of its own
+        noise = y == -1
+        y += 1
+        y[noise] = y.max() + 1 + np.arange(np.count_nonzero(noise))
+        progress.setPercentage(60)
 
-            geom = f.geometry()
+        # Now write the features to the new dataset along with the label
+        fields.append(QgsField(fieldName, QVariant.Int))
+        writer = output.getVectorWriter(fields, geometry_type, crs)
 
-            out_feature.setGeometry(geom)
-            out_feature.setAttributes(attributes)
+        progress.setInfo("Writing clustered data to output")
 
-            writer.addFeature(out_feature)
+        # the labels are converted to python ints in one go
+        ScipyPointClusteringUtils.writeFeatures(
+            writer, fields, feature_geometries, feature_attributes,
+            y.tolist(), progress, 60, 30)
         del writer
 
-        num_clusters = len(np.unique(y))
+        # clusters are labelled 1 to n
+        num_clusters = int(y.max())
         self.setOutputValue(self.NUM_CLUSTERS, num_clusters)
 
         progress.setInfo("{} clusters formed.".format(num_clusters))
         progress.setPercentage(100)
 
+    def getIcon(self):
+        """Get the icon.
+        """
+        return ScipyPointClusteringUtils.getIcon()
+
     def help(self):
         """
         Get the help documentation for this algorithm.
@@ -626,7 +932,7 @@ class HierarchicalClusteringByIdentifier(HierarchicalClustering):
         help_data = open(os.path.join(
             os.path.dirname(__file__),
             "doc",
-            "hierarchical_clustering_by_identifier.html"
+            "dbscan_clustering.html"
         )).read()
 
         return True, help_data
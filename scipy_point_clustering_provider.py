@@ -32,7 +32,8 @@ __revision__ = '$Format:%H$'
 from processing.core.AlgorithmProvider import AlgorithmProvider
 from processing.core.ProcessingConfig import Setting, ProcessingConfig
 from scipy_point_clustering_algorithm import (
-    HierarchicalClustering, KMeansClustering, HierarchicalClusteringByIdentifier
+    HierarchicalClustering, KMeansClustering, HierarchicalClusteringByIdentifier,
+    DBSCANClustering, DBSCAN
 )
 from scipy_point_clustering_utils import ScipyPointClusteringUtils
 
@@ -48,6 +49,9 @@ class ScipyPointClusteringProvider(AlgorithmProvider):
 
         # Load algorithms
         self.alglist = [HierarchicalClustering(), KMeansClustering(), HierarchicalClusteringByIdentifier()]
+        # DBSCAN comes from scikit-learn, which is optional
+        if DBSCAN is not None:
+            self.alglist.append(DBSCANClustering())
         for alg in self.alglist:
             alg.provider = self
 
@@ -25,9 +25,12 @@ __author__ = 'Henry Walshaw'
 __date__ = '2016-03-18'
 __copyright__ = '(C) 2015 by Henry Walshaw'
 
+import math
 import os.path
 
 from PyQt4.QtGui import QIcon
+from qgis.core import QgsFeature
+import numpy as np
 
 # This will get replaced with a git SHA1 when you do a git archive
 
@@ -38,6 +41,32 @@ class ScipyPointClusteringUtils(object):
 
     POINT_LIMIT = 'POINT_LIMIT'
 
+    # Number of output features handed to a data provider at once
+    WRITE_BATCH_SIZE = 1000
+
+    # Number of rows of the distance matrix calculated at once
+    DISTANCE_BLOCK_SIZE = 256
+
+    # Approximate peak memory used for each pair of points within the
+    # tolerance when finding single linkage clusters with a k-d tree. The
+    # query_pairs array, the sparse graph and its conversions in
+    # connected_components all hold every pair.
+    TREE_BYTES_PER_PAIR = 50
+
+    # Approximate peak memory used for each pair of points within the
+    # tolerance by DBSCAN, which keeps the neighbours of every point
+    DBSCAN_BYTES_PER_PAIR = 26
+
+    # Approximate length of a degree of latitude in metres
+    METRES_PER_DEGREE = 111320.0
+
+    # Layout of the WKB for a 2D point: byte order, geometry type, x and y
+    POINT_WKB_DTYPE = np.dtype([
+        ('byte_order', 'u1'),
+        ('wkb_type', '<u4'),
+        ('xy', '<f8', (2,))
+    ])
+
     @staticmethod
     def getIcon():
         return QIcon(os.path.join(
@@ -45,3 +74,189 @@ class ScipyPointClusteringUtils(object):
             'icons',
             'seagull.png'
         ))
+
+    @staticmethod
+    def writeFeatures(writer, fields, geometries, attributes, labels,
+                      progress, offset, span):
+        """Write features to the output with their cluster label appended to
+        their attributes.
+
+        Memory and database outputs are written in batches through the data
+        provider wrapped by the processing VectorWriter. File outputs can
+        only be written a feature at a time, so they reuse a single feature.
+
+        :param writer: The output writer
+        :type writer: processing.tools.vector.VectorWriter
+        :param labels: The label of each feature, as python ints
+        :param offset: Percentage of the progress bar at the start
+        :param span: Percentage of the progress bar used while writing
+        """
+        provider = getattr(writer, 'writer', None)
+        batched = hasattr(provider, 'addFeatures')
+        batch_size = ScipyPointClusteringUtils.WRITE_BATCH_SIZE
+
+        feature_count = len(geometries)
+        progress_step = max(1, feature_count // 100)
+        out_feature = QgsFeature(fields)
+        batch = []
+        for i, geom in enumerate(geometries):
+            if i % progress_step == 0:
+                progress.setPercentage(
+                    offset + i * float(span) / feature_count
+                )
+
+            feature_attributes = attributes[i]
+            feature_attributes.append(labels[i])
+
+            if batched:
+                out_feature = QgsFeature(fields)
+            out_feature.setGeometry(geom)
+            out_feature.setAttributes(feature_attributes)
+
+            if batched:
+                batch.append(out_feature)
+                if len(batch) == batch_size:
+                    provider.addFeatures(batch)
+                    batch = []
+            else:
+                writer.addFeature(out_feature)
+        if batch:
+            provider.addFeatures(batch)
+
+    @staticmethod
+    def condensedDistances(points, identifiers, distance_function,
+                           block_size=None):
+        """Build a condensed distance matrix a block of rows at a time.
+
+        Distances between points with different identifiers are set to
+        infinity. Only one block of the square matrix is held in memory.
+
+        :param distance_function: Called with two arrays of points, returns
+            the array of distances between them
+        :param block_size: Number of rows in each block, by default
+            DISTANCE_BLOCK_SIZE
+        :return: The distances in the same order as pdist
+        :rtype: numpy.ndarray
+        """
+        if block_size is None:
+            block_size = ScipyPointClusteringUtils.DISTANCE_BLOCK_SIZE
+
+        point_count = len(points)
+        distances = np.empty(
+            point_count * (point_count - 1) // 2, dtype=np.float64)
+        if point_count < 2:
+            return distances
+
+        # Centre the points, so distance functions that expand
+        # |x - y|^2 as |x|^2 - 2x.y + |y|^2 don't lose precision on large
+        # projected coordinates
+        points = points - points.mean(axis=0)
+
+        # Row i of the condensed matrix holds the distances from point i to
+        # points i + 1 onwards, which is row i - first of the block from
+        # column i - first
+        start = 0
+        for first in range(0, point_count - 1, block_size):
+            last = min(first + block_size, point_count - 1)
+            block = distance_function(points[first:last], points[first + 1:])
+            block[identifiers[first:last, None] !=
+                  identifiers[None, first + 1:]] = np.inf
+            for i in range(first, last):
+                end = start + point_count - 1 - i
+                distances[start:end] = block[i - first, i - first:]
+                start = end
+        return distances
+
+    @staticmethod
+    def countPairs(tree, tolerance, p=2):
+        """Count the pairs of points in a k-d tree within the tolerance of
+        each other, without building the pairs.
+
+        :param tree: The points
+        :type tree: scipy.spatial.cKDTree
+        :param p: The Minkowski p-norm of the distance, 1 for cityblock and 2
+            for euclidean distances
+        :rtype: int
+        """
+        # count_neighbors counts both orderings of each pair, and every point
+        # with itself
+        count = tree.count_neighbors(tree, tolerance, p=p)
+        return int(count - tree.n) // 2
+
+    @staticmethod
+    def pairLimit(point_limit, bytes_per_pair):
+        """Get the number of pairs of neighbouring points that use about as
+        much memory as the condensed distance matrix for the point limit.
+
+        :param point_limit: The plugin point limit setting
+        :param bytes_per_pair: Peak memory used for each pair of points
+        :rtype: int
+        """
+        matrix_bytes = point_limit * (point_limit - 1) // 2 * 8
+        return matrix_bytes // bytes_per_pair
+
+    @staticmethod
+    def queryPairs(tree, tolerance, p=2):
+        """Find the pairs of points in a k-d tree within the tolerance of each
+        other.
+
+        :param tree: The points
+        :type tree: scipy.spatial.cKDTree
+        :param p: The Minkowski p-norm of the distance
+        :return: The indices of each pair, one pair per row
+        :rtype: numpy.ndarray
+        """
+        try:
+            return tree.query_pairs(tolerance, p=p, output_type='ndarray')
+        except TypeError:
+            # older scipy only returns a set of tuples
+            return np.array(
+                sorted(tree.query_pairs(tolerance, p=p)), dtype=np.intp
+            ).reshape(-1, 2)
+
+    @staticmethod
+    def pointCoordinates(geometries):
+        """Get the coordinates of point geometries as an (n, 2) array.
+
+        When every geometry is a little endian 2D point the WKB is joined
+        and read by numpy in one go, otherwise each point is read in turn.
+        """
+        point_count = len(geometries)
+        if not point_count:
+            return np.empty((0, 2), dtype=np.float64)
+
+        dtype = ScipyPointClusteringUtils.POINT_WKB_DTYPE
+        wkb = b''.join(g.asWkb() for g in geometries)
+        if len(wkb) == point_count * dtype.itemsize:
+            records = np.frombuffer(wkb, dtype=dtype)
+            if ((records['byte_order'] == 1).all() and
+                    (records['wkb_type'] == 1).all()):
+                return records['xy'].astype(np.float64)
+
+        points = np.empty((point_count, 2), dtype=np.float64)
+        for i, g in enumerate(geometries):
+            p = g.asPoint()
+            points[i, 0] = p.x()
+            points[i, 1] = p.y()
+        return points
+
+    @staticmethod
+    def projectGeographic(points, crs):
+        """Project geographic coordinates in place onto a local plane in
+        metres.
+
+        An equirectangular projection about the mean latitude is used, which
+        is accurate enough for clustering. Points in a projected coordinate
+        system are left unchanged.
+
+        :return: The x and y scale factors applied to the points
+        :rtype: numpy.ndarray
+        """
+        if not len(points) or not crs.geographicFlag():
+            return np.ones(2)
+
+        lat0 = points[:, 1].mean()
+        scale = ScipyPointClusteringUtils.METRES_PER_DEGREE * np.array(
+            [math.cos(math.radians(lat0)), 1.0])
+        points *= scale
+        return scale
@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the Scipy Point Clustering utilities.
+
+Run from the plugin directory with ``python -m pytest test``.
+"""
+
+__author__ = 'Henry Walshaw'
+__date__ = '2016-03-18'
+__copyright__ = '(C) 2016 by Henry Walshaw'
+
+import struct
+import unittest
+
+import numpy as np
+from scipy.spatial import cKDTree
+from scipy.spatial.distance import cdist, pdist
+
+from scipy_point_clustering_utils import ScipyPointClusteringUtils
+
+try:
+    from sklearn.metrics import pairwise_distances
+except ImportError:
+    pairwise_distances = None
+
+
+class FakePoint(object):
+    """Stand in for a QgsPoint."""
+
+    def __init__(self, x, y):
+        self._x = x
+        self._y = y
+
+    def x(self):
+        return self._x
+
+    def y(self):
+        return self._y
+
+
+class FakeGeometry(object):
+    """Stand in for a QgsGeometry with the given WKB."""
+
+    def __init__(self, wkb, x, y, read_points=True):
+        self.wkb = wkb
+        self.point = FakePoint(x, y)
+        self.read_points = read_points
+
+    def asWkb(self):
+        return self.wkb
+
+    def asPoint(self):
+        if not self.read_points:
+            raise AssertionError("point read instead of the WKB")
+        return self.point
+
+
+def point_2d(x, y, **kwargs):
+    return FakeGeometry(struct.pack('<BIdd', 1, 1, x, y), x, y, **kwargs)
+
+
+def point_25d(x, y, z):
+    return FakeGeometry(
+        struct.pack('<BIddd', 1, 0x80000001, x, y, z), x, y)
+
+
+def point_big_endian(x, y):
+    return FakeGeometry(struct.pack('>BIdd', 0, 1, x, y), x, y)
+
+
+class PointCoordinatesTest(unittest.TestCase):
+    """Read point coordinates from the WKB, or from each point."""
+
+    coordinates = [(1.5, -2.25), (300000.125, 5800000.5), (0.0, 0.0)]
+
+    def test_2d_points(self):
+        geometries = [
+            point_2d(x, y, read_points=False) for x, y in self.coordinates]
+        points = ScipyPointClusteringUtils.pointCoordinates(geometries)
+        self.assertEqual(points.dtype, np.float64)
+        np.testing.assert_array_equal(points, self.coordinates)
+        # the result must be writable for projectGeographic
+        points *= 2
+
+    def test_25d_point_falls_back(self):
+        geometries = [point_2d(x, y) for x, y in self.coordinates]
+        geometries.insert(1, point_25d(7.0, 8.0, 9.0))
+        np.testing.assert_array_equal(
+            ScipyPointClusteringUtils.pointCoordinates(geometries),
+            [self.coordinates[0], (7.0, 8.0)] + self.coordinates[1:]
+        )
+
+    def test_big_endian_point_falls_back(self):
+        # same WKB length as a little endian point, so only the byte order
+        # check can catch it
+        geometries = [point_2d(x, y) for x, y in self.coordinates]
+        geometries.append(point_big_endian(7.0, 8.0))
+        np.testing.assert_array_equal(
+            ScipyPointClusteringUtils.pointCoordinates(geometries),
+            self.coordinates + [(7.0, 8.0)]
+        )
+
+    def test_empty(self):
+        points = ScipyPointClusteringUtils.pointCoordinates([])
+        self.assertEqual(points.shape, (0, 2))
+
+
+class CondensedDistancesTest(unittest.TestCase):
+    """Compare the blocked condensed distances with a masked pdist."""
+
+    def setUp(self):
+        random = np.random.RandomState(0)
+        self.points = random.uniform(0, 100, (11, 2))
+        self.identifiers = random.randint(0, 3, 11)
+
+    def expected(self, points, identifiers, metric='euclidean'):
+        expected = pdist(points, metric=metric)
+        rows, cols = np.triu_indices(len(points), 1)
+        expected[identifiers[rows] != identifiers[cols]] = np.inf
+        return expected
+
+    def condensed(self, points, identifiers, metric='euclidean', **kwargs):
+        return ScipyPointClusteringUtils.condensedDistances(
+            points, identifiers,
+            lambda a, b: cdist(a, b, metric=metric),
+            **kwargs
+        )
+
+    def test_several_blocks(self):
+        for block_size in (1, 3, 4, 10):
+            np.testing.assert_allclose(
+                self.condensed(self.points, self.identifiers,
+                               block_size=block_size),
+                self.expected(self.points, self.identifiers)
+            )
+
+    def test_single_block(self):
+        np.testing.assert_allclose(
+            self.condensed(self.points, self.identifiers),
+            self.expected(self.points, self.identifiers)
+        )
+
+    def test_cityblock(self):
+        np.testing.assert_allclose(
+            self.condensed(self.points, self.identifiers, 'cityblock',
+                           block_size=4),
+            self.expected(self.points, self.identifiers, 'cityblock')
+        )
+
+    def test_two_points(self):
+        points = self.points[:2]
+        for identifiers in (np.array([0, 0]), np.array([0, 1])):
+            np.testing.assert_allclose(
+                self.condensed(points, identifiers),
+                self.expected(points, identifiers)
+            )
+
+    def test_one_point(self):
+        self.assertEqual(
+            self.condensed(self.points[:1], self.identifiers[:1]).shape,
+            (0,)
+        )
+
+    @unittest.skipIf(pairwise_distances is None, 'scikit-learn not installed')
+    def test_large_coordinates(self):
+        # coincident points on large projected coordinates must stay at
+        # (almost) zero distance
+        points = np.vstack([self.points, self.points[:3]]) + 5e6
+        identifiers = np.zeros(len(points), dtype=np.int32)
+        distances = ScipyPointClusteringUtils.condensedDistances(
+            points, identifiers,
+            lambda a, b: pairwise_distances(a, b), block_size=4
+        )
+        np.testing.assert_allclose(
+            distances, self.expected(points, identifiers), atol=1e-6)
+
+
+class CountPairsTest(unittest.TestCase):
+    """Compare the pair count with the pairs found by the k-d tree."""
+
+    def test_count_pairs(self):
+        random = np.random.RandomState(0)
+        # include some coincident points
+        points = np.vstack([random.uniform(0, 10, (50, 2))] * 2)
+        tree = cKDTree(points)
+        for tolerance in (0.5, 2.0, 20.0):
+            for p in (1, 2):
+                self.assertEqual(
+                    ScipyPointClusteringUtils.countPairs(tree, tolerance, p),
+                    len(tree.query_pairs(tolerance, p=p))
+                )
+
+
+class PairLimitTest(unittest.TestCase):
+    """Check the pair limit matches the memory of the distance matrix."""
+
+    def test_pair_limit(self):
+        # one 8 byte distance per pair is the condensed matrix itself
+        self.assertEqual(
+            ScipyPointClusteringUtils.pairLimit(10000, 8), 10000 * 9999 // 2)
+        self.assertEqual(
+            ScipyPointClusteringUtils.pairLimit(10000, 50),
+            10000 * 9999 // 2 * 8 // 50)
+
+
+class QueryPairsTest(unittest.TestCase):
+    """Check the pairs are the same with and without output_type."""
+
+    class OldTree(object):
+        """k-d tree without the output_type argument of query_pairs."""
+
+        def __init__(self, tree):
+            self.tree = tree
+
+        def query_pairs(self, r, p=2.):
+            return self.tree.query_pairs(r, p=p)
+
+    def test_query_pairs(self):
+        random = np.random.RandomState(0)
+        tree = cKDTree(random.uniform(0, 10, (50, 2)))
+        expected = np.array(sorted(tree.query_pairs(2.0)))
+        for t in (tree, self.OldTree(tree)):
+            pairs = ScipyPointClusteringUtils.queryPairs(t, 2.0)
+            self.assertEqual(pairs.shape, expected.shape)
+            np.testing.assert_array_equal(
+                pairs[np.lexsort(pairs.T[::-1])], expected)
+
+    def test_no_pairs(self):
+        tree = cKDTree(np.array([[0.0, 0.0], [10.0, 10.0]]))
+        old_tree = self.OldTree(tree)
+        self.assertEqual(
+            ScipyPointClusteringUtils.queryPairs(old_tree, 1.0).shape, (0, 2))
+
+
+class FakeCrs(object):
+    """Stand in for a QgsCoordinateReferenceSystem."""
+
+    def __init__(self, geographic):
+        self.geographic = geographic
+
+    def geographicFlag(self):
+        return self.geographic
+
+
+class ProjectGeographicTest(unittest.TestCase):
+    """Scale geographic coordinates to metres around their mean latitude."""
+
+    def test_projected(self):
+        points = np.array([[300000.0, 5800000.0], [300100.0, 5800050.0]])
+        original = points.copy()
+        scale = ScipyPointClusteringUtils.projectGeographic(
+            points, FakeCrs(False))
+        np.testing.assert_array_equal(scale, np.ones(2))
+        np.testing.assert_array_equal(points, original)
+
+    def test_geographic(self):
+        # both points at 60 degrees north, where a degree of longitude is
+        # half a degree of latitude
+        points = np.array([[10.0, 60.0], [10.001, 60.0]])
+        ScipyPointClusteringUtils.projectGeographic(points, FakeCrs(True))
+        self.assertAlmostEqual(
+            points[1, 0] - points[0, 0],
+            0.001 * ScipyPointClusteringUtils.METRES_PER_DEGREE / 2,
+            places=6
+        )
+        self.assertEqual(points[0, 1], points[1, 1])
+
+        points = np.array([[10.0, 59.5], [10.0, 60.5]])
+        ScipyPointClusteringUtils.projectGeographic(points, FakeCrs(True))
+        self.assertAlmostEqual(
+            points[1, 1] - points[0, 1],
+            ScipyPointClusteringUtils.METRES_PER_DEGREE,
+            places=6
+        )
+
+    def test_scale_round_trip(self):
+        points = np.array([[-122.4, 37.8], [-122.3, 37.7], [-122.5, 37.9]])
+        original = points.copy()
+        scale = ScipyPointClusteringUtils.projectGeographic(
+            points, FakeCrs(True))
+        np.testing.assert_allclose(points / scale, original)
+
+    def test_empty(self):
+        points = np.empty((0, 2))
+        scale = ScipyPointClusteringUtils.projectGeographic(
+            points, FakeCrs(True))
+        np.testing.assert_array_equal(scale, np.ones(2))
+
+
+if __name__ == '__main__':
+    unittest.main()